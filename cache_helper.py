@@ -1,16 +1,25 @@
 import redis
-import json
+import msgpack
+import functools
 import hashlib
 import time
+from collections import OrderedDict
 
 class CacheHelper:
     """Redis 缓存辅助类 - Cache-Aside Pattern"""
     
-    def __init__(self, host='localhost', port=6379, db=0, ttl=300):
+    def __init__(self, host='localhost', port=6379, db=0, ttl=300, l1_size=1024):
+        # 进程内 L1 缓存（LRU）：key -> (过期时间, msgpack 字节)，命中时不经过网络；l1_size=0 关闭
+        # 存编码后的字节，每次命中解码出新对象：返回类型与 Redis 命中一致，调用方修改结果也不会污染缓存
+        self.l1 = OrderedDict()
+        self.l1_size = l1_size
+        self.ttl = ttl
         try:
-            self.client = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+            # 使用原始 bytes，值以 msgpack 二进制编码存取
+            self.client = redis.Redis(host=host, port=port, db=db, decode_responses=False)
             self.client.ping()
-            self.ttl = ttl
+            self.pack = functools.partial(msgpack.packb, default=str, use_bin_type=True)
+            self.unpack = functools.partial(msgpack.unpackb, raw=False)
             self.enabled = True
         except Exception as e:
             print(f"警告: Redis 连接失败 ({e})，缓存功能已禁用")
@@ -21,30 +30,109 @@ class CacheHelper:
             return None
         try:
             data = self.client.get(key)
-            return json.loads(data) if data else None
+            return self.unpack(data) if data else None
         except:
             return None
+
+    def mget(self, keys):
+        """一次往返批量读取多个 key，未命中的位置为 None"""
+        if not self.enabled or not keys:
+            return [None] * len(keys)
+        try:
+            return [self.unpack(data) if data else None for data in self.client.mget(keys)]
+        except:
+            return [None] * len(keys)
     
+    def _l1_get(self, key):
+        entry = self.l1.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.l1[key]
+            return None
+        self.l1.move_to_end(key)
+        return entry[1]
+
+    def _l1_set(self, key, value, ttl=None):
+        if self.l1_size <= 0:
+            return
+        self.l1[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self.l1.move_to_end(key)
+        if len(self.l1) > self.l1_size:
+            self.l1.popitem(last=False)
+
     def set(self, key, value, ttl=None):
         if not self.enabled:
             return False
+        try:
+            return self._set_packed(key, self.pack(value), ttl)
+        except:
+            return False
+
+    def _set_packed(self, key, packed, ttl=None):
+        """写入已编码的值，返回是否成功"""
+        self.l1.pop(key, None)
+        try:
+            self.client.setex(key, ttl or self.ttl, packed)
+            return True
+        except:
+            return False
+
+    def mset_ex(self, mapping, ttl=None):
+        """通过 pipeline 一次往返批量写入多个 key（均带过期时间）"""
+        if not self.enabled or not mapping:
+            return False
+        for key in mapping:
+            self.l1.pop(key, None)
         try:
             ttl = ttl or self.ttl
-            self.client.setex(key, ttl, json.dumps(value, default=str))
+            with self.client.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    pipe.setex(key, ttl, self.pack(value))
+                pipe.execute()
             return True
         except:
             return False
     
     def cache_aside(self, key, fetch_func, ttl=None):
-        """Cache-Aside 模式：先查缓存，未命中则查数据库并写回"""
-        cached = self.get(key)
-        if cached is not None:
-            return cached
-        
+        """Cache-Aside 模式：依次查进程内 L1、Redis，都未命中则查数据库并写回两级缓存"""
+        packed = self._l1_get(key)
+        if packed is not None:
+            return self.unpack(packed)
+
+        if self.enabled:
+            try:
+                packed = self.client.get(key)
+            except:
+                packed = None
+            if packed:
+                self._l1_set(key, packed, ttl)
+                return self.unpack(packed)
+
         data = fetch_func()
-        self.set(key, data, ttl)
-        return data
+        if not self.enabled:
+            return data
+        try:
+            packed = self.pack(data)
+        except:
+            return data
+        if self._set_packed(key, packed, ttl):
+            self._l1_set(key, packed, ttl)
+        # 与缓存命中时一样返回解码后的新对象
+        return self.unpack(packed)
+
+    def cache_aside_many(self, keys, fetch_func, ttl=None):
+        """批量 Cache-Aside：一次 MGET 查缓存，fetch_func 接收未命中的 key 列表并按相同顺序返回数据"""
+        results = self.mget(keys)
+        missing = [key for key, value in zip(keys, results) if value is None]
+        if not missing:
+            return results
+
+        fetched = dict(zip(missing, fetch_func(missing)))
+        self.mset_ex(fetched, ttl)
+        return [fetched[key] if value is None else value for key, value in zip(keys, results)]
     
     def clear_all(self):
+        self.l1.clear()
         if self.enabled:
             self.client.flushdb()
\ No newline at end of file
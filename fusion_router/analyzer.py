@@ -3,6 +3,7 @@
 分析SQL查询，决定路由到哪个数据库
 """
 import re
+import functools
 from typing import Dict, Any
 
 
@@ -16,24 +17,6 @@ class QueryAnalyzer:
                 re.IGNORECASE
             ),
 
-            # 关联查询 -> MySQL
-            'join_query': re.compile(
-                r"\b(?:JOIN|INNER JOIN|LEFT JOIN|RIGHT JOIN|OUTER JOIN)\b",
-                re.IGNORECASE
-            ),
-
-            # 全文搜索 -> MongoDB
-            'fulltext_query': re.compile(
-                r"LIKE\s*['\"]?%.*%['\"]?",
-                re.IGNORECASE
-            ),
-
-            # 复杂聚合 -> 根据数据量决定
-            'complex_aggregation': re.compile(
-                r"\b(?:GROUP BY|HAVING|ROLLUP|CUBE)\b",
-                re.IGNORECASE
-            ),
-
             # 简单查询 -> 根据表类型决定
             'simple_select': re.compile(
                 r"SELECT\s+.*?\s+FROM\s+(\w+)",
@@ -41,28 +24,61 @@ class QueryAnalyzer:
             )
         }
 
-        # 表到数据库的映射
-        self.table_mapping = {
-            # 关系型表 -> MySQL
-            'customers': 'mysql',
-            'products': 'mysql',
-            'sellers': 'mysql',
-            'geolocation': 'mysql',
-            'category_translation': 'mysql',
-
-            # 文档型表 -> MongoDB
-            'orders': 'mongo',
-            'order_items': 'mongo',  # 实际会嵌入到orders
-            'order_payments': 'mongo',
-            'order_reviews': 'mongo'
-        }
+        # 路由关键字单次扫描：一遍 finditer 得到 SQL 中出现的全部特征，避免多次 search
+        # - join_query: 关联查询 -> MySQL
+        # - fulltext_query: 全文搜索 -> MongoDB
+        # - complex_aggregation: 复杂聚合 -> 根据数据量决定
+        self.keyword_scanner = re.compile(
+            r"(?P<join_query>\bJOIN\b)"
+            r"|(?P<fulltext_query>LIKE(?=\s*['\"]?%.*%))"
+            r"|(?P<complex_aggregation>\b(?:GROUP BY|HAVING|ROLLUP|CUBE)\b)",
+            re.IGNORECASE
+        )
+
+        # JOIN 查询中提取全部表名：单个捕获组，一次扫描
+        self._table_extract = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)', re.IGNORECASE)
+
+        # 表到数据库的映射（frozenset 成员判断，表名统一小写）
+        # 关系型表 -> MySQL
+        self._mysql_tables = frozenset({
+            'customers', 'products', 'sellers', 'geolocation', 'category_translation'
+        })
+        # 文档型表 -> MongoDB（order_items 实际会嵌入到orders）
+        self._mongo_tables = frozenset({
+            'orders', 'order_items', 'order_payments', 'order_reviews'
+        })
+        # 点查询走 MongoDB 的表
+        self._mongo_point_tables = frozenset({'orders', 'order_items'})
 
-    def analyze(self, sql: str) -> Dict[str, Any]:
+        # 分析结果缓存：同一条 SQL 反复出现时直接命中，不再重复正则匹配
+        self._analyze_cached = functools.lru_cache(maxsize=4096)(self._analyze)
+
+    def _db_of(self, table: str) -> str:
         """
-        分析SQL查询，返回路由决策
+        返回表所在的数据库：'mysql' / 'mongo' / 'unknown'
         """
-        sql = sql.strip()
+        table = table.lower()
+        if table in self._mysql_tables:
+            return 'mysql'
+        if table in self._mongo_tables:
+            return 'mongo'
+        return 'unknown'
 
+    def analyze(self, sql: str) -> Dict[str, Any]:
+        """
+        分析SQL查询，返回路由决策（带 LRU 缓存）
+        """
+        # 返回浅副本（嵌套的 params/tables 单独复制），避免调用方修改缓存中的结果
+        cached = self._analyze_cached(sql.strip())
+        result = {**cached, 'params': dict(cached['params'])}
+        if 'tables' in cached:
+            result['tables'] = list(cached['tables'])
+        return result
+
+    def _analyze(self, sql: str) -> Dict[str, Any]:
+        """
+        实际的分析逻辑，sql 需已去除首尾空白
+        """
         # 默认分析结果
         analysis = {
             'sql': sql,
@@ -84,7 +100,7 @@ class QueryAnalyzer:
             })
 
             # 点查询优先使用MongoDB（如果表在MongoDB中）
-            if table in ['orders', 'order_items']:
+            if table.lower() in self._mongo_point_tables:
                 analysis.update({
                     'db_type': 'mongo',
                     'reason': f'Point query on {table}.{column}, MongoDB更擅长'
@@ -96,14 +112,16 @@ class QueryAnalyzer:
                 })
             return analysis
 
+        # 一次扫描得到 SQL 中出现的路由关键字
+        features = {m.lastgroup for m in self.keyword_scanner.finditer(sql)}
+
         # 2. 检查是否是关联查询
-        if self.patterns['join_query'].search(sql):
+        if 'join_query' in features:
             # 找出涉及的所有表
-            tables = re.findall(r'\bFROM\s+(\w+)|\bJOIN\s+(\w+)', sql, re.IGNORECASE)
-            tables = [t for group in tables for t in group if t]
+            tables = self._table_extract.findall(sql)
 
             # 检查是否涉及多个数据库
-            db_types = set(self.table_mapping.get(t, 'unknown') for t in tables)
+            db_types = {self._db_of(t) for t in tables}
 
             if len(db_types) > 1:
                 # 跨数据库查询
@@ -124,7 +142,7 @@ class QueryAnalyzer:
             return analysis
 
         # 3. 检查是否是全文搜索
-        if self.patterns['fulltext_query'].search(sql):
+        if 'fulltext_query' in features:
             analysis.update({
                 'query_type': 'fulltext_search',
                 'db_type': 'mongo',
@@ -136,7 +154,9 @@ class QueryAnalyzer:
         match = self.patterns['simple_select'].search(sql)
         if match:
             table = match.group(1)
-            db_type = self.table_mapping.get(table, 'mysql')
+            db_type = self._db_of(table)
+            if db_type == 'unknown':
+                db_type = 'mysql'
             analysis.update({
                 'table': table,
                 'query_type': 'simple_select',
@@ -1,16 +1,37 @@
 import pandas as pd
+import pyarrow.csv as pv
 from sqlalchemy import create_engine, text
 from sqlalchemy.types import VARCHAR, TEXT, Integer, Float, DateTime
-from pymongo import MongoClient
+from pymongo import MongoClient, WriteConcern
 import time
 import os
+import itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+def read_csv_arrow(file_path):
+    """pyarrow 多线程解析 CSV，时间戳在解析时直接识别，返回 Arrow 列存的 DataFrame"""
+    convert_options = pv.ConvertOptions(
+        timestamp_parsers=['%Y-%m-%d %H:%M:%S'],
+        strings_can_be_null=True  # 与 pd.read_csv 一致：空串视为缺失值
+    )
+    # 评论正文的引号字段内含换行，需允许值中换行，否则跨块时解析器与分块器失去同步
+    parse_options = pv.ParseOptions(newlines_in_values=True)
+    return pv.read_csv(file_path, parse_options=parse_options,
+                       convert_options=convert_options).to_pandas(types_mapper=pd.ArrowDtype)
 
 
 class DataLoader:
-    def __init__(self, mysql_uri, mongo_uri, dataset_dir="./dataset"):
+    def __init__(self, mysql_uri, mongo_uri, dataset_dir="./dataset", use_load_data=False):
         print(mysql_uri)
-        self.mysql_engine = create_engine(mysql_uri)
-        self.mongo_client = MongoClient(mongo_uri)
+        # use_load_data: 用 LOAD DATA LOCAL INFILE 导入 MySQL（需服务端开启 local_infile），失败时回退到 to_sql
+        self.use_load_data = use_load_data
+        connect_args = {'allow_local_infile': True} if use_load_data else {}
+        # 并行导入时每个线程各占一个连接
+        self.load_workers = 4
+        self.mysql_engine = create_engine(mysql_uri, pool_size=8, max_overflow=4, connect_args=connect_args)
+        self.mongo_client = MongoClient(mongo_uri, compressors='zstd,zlib', maxPoolSize=50, retryWrites=True)
         self.dataset_dir = dataset_dir
 
         db_name = mysql_uri.split('/')[-1].split('?')[0]
@@ -22,6 +43,29 @@ class DataLoader:
             return None
         return value
 
+    def load_data_infile(self, file_path, table_name, columns):
+        """LOAD DATA LOCAL INFILE：由 MySQL 服务端直接解析 CSV，返回写入行数"""
+        path = os.path.abspath(file_path).replace('\\', '/')
+        # 先读入用户变量，空串转 NULL（空日期/数值在严格模式下会报错）
+        col_vars = ", ".join(f"@{col}" for col in columns)
+        set_clause = ", ".join(f"`{col}` = NULLIF(@{col}, '')" for col in columns)
+        sql = (
+            f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table_name} "
+            "CHARACTER SET utf8mb4 "
+            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+            "IGNORE 1 LINES "
+            f"({col_vars}) SET {set_clause}"
+        )
+
+        raw_conn = self.mysql_engine.raw_connection()
+        try:
+            cursor = raw_conn.cursor()
+            cursor.execute(sql)
+            raw_conn.commit()
+            return cursor.rowcount
+        finally:
+            raw_conn.close()
+
     def load_mysql_data(self):
         """加载数据到MySQL"""
         print("\n=== 加载数据到 MySQL ===")
@@ -79,127 +123,140 @@ class DataLoader:
         print("\n=== 开始数据加载 ===")
         start_total = time.time()
 
-        for filename, table_name in files.items():
-            file_path = os.path.join(self.dataset_dir, filename)
-            if not os.path.exists(file_path):
-                print(f"警告: 文件 {filename} 不存在，跳过。")
-                continue
-
-            print(f"正在处理 {filename} -> 表: {table_name} ...")
-            df = pd.read_csv(file_path)
-            
-            # 简单的预处理：转换日期列
-            if 'order_purchase_timestamp' in df.columns:
-                date_cols = [col for col in df.columns if 'date' in col or 'timestamp' in col]
-                for col in date_cols:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
-            
-            # 筛选出当前 DataFrame 中存在的列的类型映射
-            dtype_mapping = {col: column_types[col] for col in df.columns if col in column_types}
-
-            # 写入数据库
-            start_table = time.time()
-            df.to_sql(
-                name=table_name, 
-                con=self.mysql_engine, 
-                if_exists='replace', 
-                index=False, 
-                chunksize=1000,
-                dtype=dtype_mapping  # 关键修改：传入类型映射
-            )
-            end_table = time.time()
-            
-            print(f"  - 成功写入 {len(df)} 行，耗时: {end_table - start_table:.2f} 秒")
-                
+        # 各表相互独立：并行导入，CSV 解析与网络写入相互重叠；输出统一在主线程打印
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.load_workers) as executor:
+            for filename, table_name in files.items():
+                file_path = os.path.join(self.dataset_dir, filename)
+                if not os.path.exists(file_path):
+                    print(f"警告: 文件 {filename} 不存在，跳过。")
+                    continue
+
+                print(f"正在处理 {filename} -> 表: {table_name} ...")
+                future = executor.submit(self._load_one_table, file_path, table_name, column_types)
+                futures[future] = table_name
+
+            for future in as_completed(futures):
+                table_name = futures[future]
+                try:
+                    rows, elapsed, note = future.result()
+                    print(f"  - {table_name}: 成功写入 {rows} 行{note}，耗时: {elapsed:.2f} 秒")
+                except Exception as e:
+                    print(f"  - {table_name}: 写入失败: {e}")
 
         end_total = time.time()
         print(f"=== 数据加载完成，总耗时: {end_total - start_total:.2f} 秒 ===\n")
 
+    def _load_one_table(self, file_path, table_name, column_types):
+        """加载单个 CSV 到 MySQL 表，返回 (行数, 耗时, 备注)"""
+        if self.use_load_data:
+            try:
+                # 用前若干行推断列类型，空表建好后数据交给服务端读取源 CSV
+                sample = pd.read_csv(file_path, nrows=1000)
+                dtype_mapping = {col: column_types[col] for col in sample.columns if col in column_types}
+                start_table = time.time()
+                sample.head(0).to_sql(
+                    name=table_name,
+                    con=self.mysql_engine,
+                    if_exists='replace',
+                    index=False,
+                    dtype=dtype_mapping
+                )
+                rows = self.load_data_infile(file_path, table_name, list(sample.columns))
+                return rows, time.time() - start_table, " (LOAD DATA)"
+            except Exception as e:
+                print(f"  - {table_name}: LOAD DATA 失败，回退到 to_sql: {e}")
+
+        # 只读表头，确定当前文件的类型映射与日期列
+        header = pd.read_csv(file_path, nrows=0).columns
+        dtype_mapping = {col: column_types[col] for col in header if col in column_types}
+        date_cols = [col for col, col_type in dtype_mapping.items() if isinstance(col_type, DateTime)]
+
+        # method='multi' 才会把每个 chunk 合并为一条多行 INSERT；单条语句的占位符数不超过 65535，
+        # 含 TEXT 长列的表减小批次，避免超过 max_allowed_packet
+        chunksize = 1000 if table_name == 'order_reviews' else min(50000, 65535 // len(header))
+        start_table = time.time()
+
+        # 分块读取并逐块写入，内存峰值与单块大小相关而非整个文件
+        reader = pd.read_csv(file_path, parse_dates=date_cols, date_format='%Y-%m-%d %H:%M:%S',
+                             chunksize=100_000)
+        rows = 0
+        for i, chunk in enumerate(reader):
+            chunk.to_sql(
+                name=table_name,
+                con=self.mysql_engine,
+                if_exists='replace' if i == 0 else 'append',
+                index=False,
+                chunksize=chunksize,
+                method='multi',
+                dtype=dtype_mapping  # 关键修改：传入类型映射
+            )
+            rows += len(chunk)
+        return rows, time.time() - start_table, ""
+
     def load_mongo_data(self):
         """加载数据到MongoDB（使用反规范化设计）"""
         print("\n=== 加载数据到 MongoDB ===")
 
         try:
-            # 读取CSV文件
-            df_orders = pd.read_csv(os.path.join(self.dataset_dir, 'olist_orders_dataset.csv'))
-            df_items = pd.read_csv(os.path.join(self.dataset_dir, 'olist_order_items_dataset.csv'))
-            df_reviews = pd.read_csv(os.path.join(self.dataset_dir, 'olist_order_reviews_dataset.csv'))
-
-            # 转换日期并清理 NaT 值
-            date_cols = [c for c in df_orders.columns if 'date' in c or 'timestamp' in c]
-            for c in date_cols:
-                df_orders[c] = pd.to_datetime(df_orders[c], errors='coerce')
-
-            # 处理其他数据集的日期列
-            if 'shipping_limit_date' in df_items.columns:
-                df_items['shipping_limit_date'] = pd.to_datetime(df_items['shipping_limit_date'], errors='coerce')
-
-            if 'review_creation_date' in df_reviews.columns:
-                df_reviews['review_creation_date'] = pd.to_datetime(df_reviews['review_creation_date'], errors='coerce')
-            if 'review_answer_timestamp' in df_reviews.columns:
-                df_reviews['review_answer_timestamp'] = pd.to_datetime(df_reviews['review_answer_timestamp'],
-                                                                       errors='coerce')
+            # 重新导入前删除集合（连同索引），插入时不必维护索引；索引在导入完成后由 create_indexes() 统一创建
+            self.mongo_db.orders.drop()
+
+            # 读取CSV文件（日期列由 pyarrow 在解析时转换）
+            df_orders = read_csv_arrow(os.path.join(self.dataset_dir, 'olist_orders_dataset.csv'))
+            df_items = read_csv_arrow(os.path.join(self.dataset_dir, 'olist_order_items_dataset.csv'))
+            df_reviews = read_csv_arrow(os.path.join(self.dataset_dir, 'olist_order_reviews_dataset.csv'))
+
+            # 一次性把 NaN/NaT 替换为 None（向量化），不再逐行逐字段 pd.isna
+            df_orders = df_orders.astype(object).where(df_orders.notna(), None)
+            df_items = df_items.astype(object).where(df_items.notna(), None)
+            df_reviews = df_reviews.astype(object).where(df_reviews.notna(), None)
 
             # 分组数据
             print("正在聚合订单数据...")
-            items_grp = df_items.groupby('order_id')
-            reviews_grp = df_reviews.groupby('order_id')
+            # 一次遍历建好 order_id -> 记录列表 的字典，循环内只做哈希查找
+            items_by_oid = {oid: g.to_dict('records') for oid, g in df_items.groupby('order_id', sort=False)}
+            reviews_by_oid = {oid: g.to_dict('records') for oid, g in df_reviews.groupby('order_id', sort=False)}
 
             # 构建嵌套文档
-            orders_buffer = []
-            batch_size = 5000
+            batch_size = 20000
+            max_pending = 2  # 在途批次上限（背压），限制内存中同时存在的文档数
             total_orders = 0
+            # 批量导入：w=1 且不等待 journal；insert_many 使用 ordered=False，服务端可并行写入
+            orders_coll = self.mongo_db.get_collection('orders', write_concern=WriteConcern(w=1, j=False))
+
+            def iter_orders():
+                # 按批把 DataFrame 转成字典，边生成边插入，不一次性物化全部订单
+                for start in range(0, len(df_orders), batch_size):
+                    for order in df_orders.iloc[start:start + batch_size].to_dict('records'):
+                        oid = order['order_id']
+
+                        # 嵌入Items / Reviews
+                        order['items'] = items_by_oid.get(oid, [])
+                        order['reviews'] = reviews_by_oid.get(oid, [])
+                        yield order
+
+            def insert_batch(batch):
+                orders_coll.insert_many(batch, ordered=False, bypass_document_validation=True)
+                return len(batch)
 
             start_time = time.time()
 
-            for order in df_orders.to_dict('records'):
-                oid = order['order_id']
-
-                # 清理订单中的日期字段
-                for key in list(order.keys()):
-                    if isinstance(order[key], pd.Timestamp) and pd.isna(order[key]):
-                        order[key] = None
-                    elif pd.isna(order[key]):
-                        order[key] = None
-
-                # 嵌入Items
-                if oid in items_grp.groups:
-                    items_list = []
-                    items_group = items_grp.get_group(oid)
-                    for item in items_group.to_dict('records'):
-                        # 清理items中的日期字段
-                        if 'shipping_limit_date' in item and pd.isna(item['shipping_limit_date']):
-                            item['shipping_limit_date'] = None
-                        items_list.append(item)
-                    order['items'] = items_list
-                else:
-                    order['items'] = []
-
-                # 嵌入Reviews
-                if oid in reviews_grp.groups:
-                    reviews_list = []
-                    reviews_group = reviews_grp.get_group(oid)
-                    for review in reviews_group.to_dict('records'):
-                        # 清理reviews中的日期字段
-                        for date_key in ['review_creation_date', 'review_answer_timestamp']:
-                            if date_key in review and pd.isna(review[date_key]):
-                                review[date_key] = None
-                        reviews_list.append(review)
-                    order['reviews'] = reviews_list
-                else:
-                    order['reviews'] = []
-
-                orders_buffer.append(order)
-
-                if len(orders_buffer) >= batch_size:
-                    self.mongo_db.orders.insert_many(orders_buffer)
-                    total_orders += len(orders_buffer)
-                    orders_buffer = []
-                    print(f"  - 已插入 {total_orders} 个聚合订单...")
-
-            if orders_buffer:
-                self.mongo_db.orders.insert_many(orders_buffer)
-                total_orders += len(orders_buffer)
+            # 主线程构建下一批文档的同时，后台线程写入上一批
+            orders_iter = iter_orders()
+            pending = deque()
+            with ThreadPoolExecutor(max_workers=max_pending) as executor:
+                while True:
+                    batch = list(itertools.islice(orders_iter, batch_size))
+                    if not batch:
+                        break
+                    if len(pending) >= max_pending:
+                        total_orders += pending.popleft().result()
+                        print(f"  - 已插入 {total_orders} 个聚合订单...")
+                    pending.append(executor.submit(insert_batch, batch))
+
+                while pending:
+                    total_orders += pending.popleft().result()
 
             print(f"✅ MongoDB 数据加载完成: {total_orders} 个订单，耗时: {time.time() - start_time:.2f}s")
 
@@ -232,16 +289,17 @@ class DataLoader:
                     print(f"  - MySQL索引创建失败: {e}")
 
         # MongoDB索引
+        # (customer_id, order_purchase_timestamp) 复合索引同时覆盖按 customer_id 的点查
         mongo_indexes = [
-            ("orders", "customer_id"),
-            ("orders", "order_purchase_timestamp"),
-            ("orders", "items.price"),
+            ("orders", [("customer_id", 1), ("order_purchase_timestamp", -1)]),
+            ("orders", [("order_purchase_timestamp", 1)]),
+            ("orders", [("items.price", 1)]),
         ]
 
-        for collection, field in mongo_indexes:
+        for collection, keys in mongo_indexes:
             try:
-                self.mongo_db[collection].create_index([(field, 1)])
-                print(f"  - MongoDB: 创建索引 {collection}.{field}")
+                index_name = self.mongo_db[collection].create_index(keys)
+                print(f"  - MongoDB: 创建索引 {collection}.{index_name}")
             except Exception as e:
                 print(f"  - MongoDB索引创建失败: {e}")
 
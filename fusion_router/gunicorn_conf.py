@@ -0,0 +1,20 @@
+# fusion_router/gunicorn_conf.py
+"""
+Fusion Router 的 gunicorn 部署配置（gevent 协程 worker）
+用法：在 fusion_router 目录下执行 gunicorn -c gunicorn_conf.py
+"""
+import os
+
+bind = "0.0.0.0:8002"
+wsgi_app = "app:app"
+pythonpath = "api"
+
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+worker_class = "gevent"
+worker_connections = 1000
+
+# 每个 worker 都会导入 app；数据加载请先通过 python api/app.py 完成
+raw_env = ["RUN_LOADER=false"]
+
+accesslog = "-"
+loglevel = "info"
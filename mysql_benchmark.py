@@ -1,10 +1,16 @@
 import pandas as pd
-from sqlalchemy import create_engine, text
-from sqlalchemy.types import VARCHAR, TEXT, Integer, Float, DateTime
+from sqlalchemy import bindparam, create_engine, text
+from sqlalchemy.types import VARCHAR, TEXT, BINARY, SmallInteger, Float, DateTime
 import time
+import timeit
 import os
+from contextlib import contextmanager
 import random
+import statistics
+import math
+from itertools import islice
 import hashlib  # ✅ CHANGED: 用稳定 hash
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from cache_helper import CacheHelper
 
 # export REDIS_HOST=127.0.0.1
@@ -19,119 +25,374 @@ DB_PORT = os.getenv('DB_PORT', '3307')
 DB_NAME = os.getenv('DB_NAME', 'olist_db')
 DATASET_DIR = os.getenv('DATASET_DIR', './dataset')
 
-CONNECTION_STR = f"mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# MySQL 驱动：mysqlconnector（默认）或 mysqldb（mysqlclient C 扩展，executemany 更快，需额外安装）
+DB_DRIVER = os.getenv('DB_DRIVER', 'mysqlconnector')
+
+CONNECTION_STR = f"mysql+{DB_DRIVER}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
 AUTO_LOAD_DATA = os.getenv('AUTO_LOAD_DATA', 'false').lower() == 'true'
+# 使用 LOAD DATA LOCAL INFILE 批量导入（docker-compose 中 MySQL 已开启 local-infile），失败时回退到 to_sql
+USE_LOAD_DATA = os.getenv('USE_LOAD_DATA', 'true').lower() == 'true'
+# 并行导入 CSV 的线程数
+LOAD_WORKERS = int(os.getenv('LOAD_WORKERS', '4'))
+# 改用多进程并行导入（每个进程独立建连接），绕开 to_sql 组装 INSERT 时的 GIL 竞争
+LOAD_PROCESSES = os.getenv('LOAD_PROCESSES', 'false').lower() == 'true'
+# CSV 解析引擎：c（默认，分块读取）或 pyarrow（多线程解析 + Arrow 列存，需安装 pyarrow，整表读入）
+CSV_ENGINE = os.getenv('CSV_ENGINE', 'c')
+# 以 BINARY(16) 存储 32 位十六进制 ID（与 fusion_router 共用同一个库时请保持关闭）
+COMPACT_IDS = os.getenv('COMPACT_IDS', 'false').lower() == 'true'
+# 每条查询的计时轮数（另有一轮不计时的预热）
+BENCH_RUNS = int(os.getenv('BENCH_RUNS', '30'))
+# 随机种子：样本抽取与热点参数选择可复现
+BENCH_SEED = int(os.getenv('BENCH_SEED', '42'))
 # ===========================================
 
+# 评论关键词搜索使用的检索词（覆盖高频与低频词）
+REVIEW_KEYWORDS = ['estão', 'bom', 'ótimo', 'ruim', 'atraso']
+
+# CSV 文件 -> 表名
+CSV_FILES = {
+    'olist_customers_dataset.csv': 'customers',
+    'olist_geolocation_dataset.csv': 'geolocation',
+    'olist_order_items_dataset.csv': 'order_items',
+    'olist_order_payments_dataset.csv': 'order_payments',
+    'olist_order_reviews_dataset.csv': 'order_reviews',
+    'olist_orders_dataset.csv': 'orders',
+    'olist_products_dataset.csv': 'products',
+    'olist_sellers_dataset.csv': 'sellers',
+    'product_category_name_translation.csv': 'category_translation'
+}
+
+COLUMN_TYPES = {
+    'customer_id': VARCHAR(32),
+    'customer_unique_id': VARCHAR(32),
+    'order_id': VARCHAR(32),
+    'product_id': VARCHAR(32),
+    'seller_id': VARCHAR(32),
+    'review_id': VARCHAR(32),
+    'customer_zip_code_prefix': VARCHAR(10),
+    'customer_city': VARCHAR(100),
+    'customer_state': VARCHAR(5),
+    'seller_zip_code_prefix': VARCHAR(10),
+    'seller_city': VARCHAR(100),
+    'seller_state': VARCHAR(5),
+    'geolocation_zip_code_prefix': VARCHAR(10),
+    'geolocation_city': VARCHAR(100),
+    'geolocation_state': VARCHAR(5),
+    'product_category_name': VARCHAR(100),
+    'payment_type': VARCHAR(50),
+    'order_status': VARCHAR(50),
+    'review_comment_title': VARCHAR(255),
+    'review_comment_message': TEXT,
+    'price': Float(),
+    'freight_value': Float(),
+    'payment_value': Float(),
+    'geolocation_lat': Float(),
+    'geolocation_lng': Float(),
+    # 取值范围很小的整数列用 SMALLINT，行宽与索引都更小
+    'review_score': SmallInteger(),
+    'order_item_id': SmallInteger(),
+    'payment_sequential': SmallInteger(),
+    'payment_installments': SmallInteger(),
+    'order_purchase_timestamp': DateTime(),
+    'order_approved_at': DateTime(),
+    'order_delivered_carrier_date': DateTime(),
+    'order_delivered_customer_date': DateTime(),
+    'order_estimated_delivery_date': DateTime(),
+    'shipping_limit_date': DateTime(),
+    'review_creation_date': DateTime(),
+    'review_answer_timestamp': DateTime()
+}
+
+# 读取 CSV 时的 pandas 类型提示（与 COLUMN_TYPES 对应），低基数文本列用 category
+PANDAS_DTYPES = {
+    'customer_id': 'string',
+    'customer_unique_id': 'string',
+    'order_id': 'string',
+    'product_id': 'string',
+    'seller_id': 'string',
+    'review_id': 'string',
+    'customer_zip_code_prefix': 'string',
+    'customer_city': 'string',
+    'customer_state': 'category',
+    'seller_zip_code_prefix': 'string',
+    'seller_city': 'string',
+    'seller_state': 'category',
+    'geolocation_zip_code_prefix': 'string',
+    'geolocation_city': 'string',
+    'geolocation_state': 'category',
+    'product_category_name': 'category',
+    'payment_type': 'category',
+    'order_status': 'category',
+    'review_comment_title': 'string',
+    'review_comment_message': 'string',
+    'price': 'float32',
+    'freight_value': 'float32',
+    'payment_value': 'float32',
+    'geolocation_lat': 'float32',
+    'geolocation_lng': 'float32',
+    'review_score': 'Int8',
+    'order_item_id': 'Int16',
+    'payment_sequential': 'Int16',
+    'payment_installments': 'Int16'
+}
+# 每张表需要在 read_csv 时解析的日期列
+DATE_COLS_BY_TABLE = {
+    'orders': [
+        'order_purchase_timestamp',
+        'order_approved_at',
+        'order_delivered_carrier_date',
+        'order_delivered_customer_date',
+        'order_estimated_delivery_date'
+    ],
+    'order_items': ['shipping_limit_date'],
+    'order_reviews': ['review_creation_date', 'review_answer_timestamp']
+}
+
+# UUID 形式（32 位十六进制）的 ID 列
+ID_COLS = ['customer_id', 'customer_unique_id', 'order_id', 'product_id', 'seller_id', 'review_id']
+
+def _hex_to_bin(value):
+    """32 位十六进制字符串 -> 16 字节，其余值视为 NULL"""
+    return bytes.fromhex(value) if isinstance(value, str) and len(value) == 32 else None
+
+def _connect_args():
+    """LOAD DATA LOCAL INFILE 需要客户端显式允许（两种驱动的参数名不同）"""
+    if not USE_LOAD_DATA:
+        return {}
+    return {'local_infile': 1} if DB_DRIVER == 'mysqldb' else {'allow_local_infile': True}
+
 def get_engine():
     """创建数据库连接引擎"""
     try:
-        temp_engine = create_engine(f"mysql+mysqlconnector://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}",
+        temp_engine = create_engine(f"mysql+{DB_DRIVER}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}",
                                     pool_pre_ping=True)
         # ✅ CHANGED: 用 begin() 自动提交，避免 CREATE DATABASE 没生效
         with temp_engine.begin() as conn:
             conn.execute(text(f"CREATE DATABASE IF NOT EXISTS {DB_NAME}"))
 
-        engine = create_engine(CONNECTION_STR, pool_pre_ping=True)
+        # 并行导入时每个线程各占一个连接；pool_recycle 避免空闲连接被 wait_timeout 断开
+        engine = create_engine(CONNECTION_STR, pool_size=8, pool_pre_ping=True, pool_recycle=300,
+                               connect_args=_connect_args())
         return engine
     except Exception as e:
         print(f"数据库连接失败: {e}")
         print("请确保 MySQL 服务已启动，且配置信息正确。")
         return None
 
-def load_data(engine):
-    """加载 CSV 数据到 MySQL"""
-    files = {
-        'olist_customers_dataset.csv': 'customers',
-        'olist_geolocation_dataset.csv': 'geolocation',
-        'olist_order_items_dataset.csv': 'order_items',
-        'olist_order_payments_dataset.csv': 'order_payments',
-        'olist_order_reviews_dataset.csv': 'order_reviews',
-        'olist_orders_dataset.csv': 'orders',
-        'olist_products_dataset.csv': 'products',
-        'olist_sellers_dataset.csv': 'sellers',
-        'product_category_name_translation.csv': 'category_translation'
-    }
-
-    column_types = {
-        'customer_id': VARCHAR(32),
-        'customer_unique_id': VARCHAR(32),
-        'order_id': VARCHAR(32),
-        'product_id': VARCHAR(32),
-        'seller_id': VARCHAR(32),
-        'review_id': VARCHAR(32),
-        'customer_zip_code_prefix': VARCHAR(10),
-        'customer_city': VARCHAR(100),
-        'customer_state': VARCHAR(5),
-        'product_category_name': VARCHAR(100),
-        'payment_type': VARCHAR(50),
-        'order_status': VARCHAR(50),
-        'review_comment_title': VARCHAR(255),
-        'review_comment_message': TEXT,
-        'price': Float(),
-        'freight_value': Float(),
-        'payment_value': Float(),
-        'review_score': Integer(),
-        'order_purchase_timestamp': DateTime(),
-        'order_approved_at': DateTime(),
-        'order_delivered_carrier_date': DateTime(),
-        'order_delivered_customer_date': DateTime(),
-        'order_estimated_delivery_date': DateTime(),
-        'shipping_limit_date': DateTime(),
-        'review_creation_date': DateTime(),
-        'review_answer_timestamp': DateTime()
+# 批量导入期间关闭唯一性与外键检查（会话级），导入结束后恢复，连接归还连接池前必须复原
+BULK_SESSION_OFF = "SET unique_checks = 0, foreign_key_checks = 0"
+BULK_SESSION_ON = "SET unique_checks = 1, foreign_key_checks = 1"
+
+@contextmanager
+def bulk_session(engine):
+    """整张表在一个事务内写入只提交一次，期间放宽会话级检查"""
+    with engine.begin() as conn:
+        is_mysql = conn.dialect.name == 'mysql'
+        if is_mysql:
+            conn.execute(text(BULK_SESSION_OFF))
+        try:
+            yield conn
+        finally:
+            if is_mysql:
+                conn.execute(text(BULK_SESSION_ON))
+
+def load_data_infile(engine, file_path, table_name, columns, binary_cols=()):
+    """使用 LOAD DATA LOCAL INFILE 将 CSV 直接交给 MySQL 服务端解析导入"""
+    path = os.path.abspath(file_path).replace('\\', '/')
+    # 先读入用户变量，再把空串转成 NULL，避免空日期/数值在严格模式下报错
+    col_vars = ", ".join(f"@{col}" for col in columns)
+    set_clause = ", ".join(
+        f"`{col}` = UNHEX(NULLIF(@{col}, ''))" if col in binary_cols else f"`{col}` = NULLIF(@{col}, '')"
+        for col in columns
+    )
+    sql = (
+        f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table_name} "
+        "CHARACTER SET utf8mb4 "
+        "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+        "IGNORE 1 LINES "
+        f"({col_vars}) SET {set_clause}"
+    )
+
+    raw_conn = engine.raw_connection()
+    try:
+        cursor = raw_conn.cursor()
+        cursor.execute(BULK_SESSION_OFF)
+        try:
+            cursor.execute(sql)
+            raw_conn.commit()
+            return cursor.rowcount
+        finally:
+            cursor.execute(BULK_SESSION_ON)
+    finally:
+        raw_conn.close()
+
+def _read_csv_arrow(file_path, dtypes, parse_dates):
+    """用 pyarrow 多线程解析整个 CSV，返回 Arrow 列存的 DataFrame（不支持分块）"""
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    # 文本列须在解析时指定类型，否则邮编等会先被推断为整数而丢失前导 0
+    arrow_types = {
+        'string': pa.string(), 'category': pa.string(),
+        'float32': pa.float32(), 'Int8': pa.int8(), 'Int16': pa.int16()
     }
-
-    print("\n=== 开始数据加载 (MySQL) ===")
-    start_total = time.time()
-
-    for filename, table_name in files.items():
-        file_path = os.path.join(DATASET_DIR, filename)
-        if not os.path.exists(file_path):
-            print(f"警告: 文件 {filename} 不存在，跳过。")
-            continue
-
-        print(f"正在处理 {filename} -> 表: {table_name} ...")
-
+    column_types = {col: arrow_types[t] for col, t in dtypes.items() if t in arrow_types}
+    column_types.update({col: pa.timestamp('s') for col in parse_dates})
+    table = pa_csv.read_csv(
+        file_path,
+        # 评论正文的引号字段内含换行，需允许值中换行，否则跨块时解析失败
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+    )
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+# executemany 每批提交的行数，避免单条多行 INSERT 超过 max_allowed_packet
+EXECUTEMANY_BATCH = 20000
+
+def _insert_rows(conn, table_name, chunk):
+    """绕过 to_sql 的逐行类型处理，直接用 DBAPI 游标 executemany 写入（驱动会改写为多行 INSERT）"""
+    placeholder = '?' if conn.dialect.paramstyle == 'qmark' else '%s'
+    columns = ", ".join(f"`{col}`" for col in chunk.columns)
+    sql = (f"INSERT INTO {table_name} ({columns}) "
+           f"VALUES ({', '.join([placeholder] * len(chunk.columns))})")
+    # 转为 Python 原生对象，NaN/NaT/NA 统一为 None（驱动不认识 numpy 标量）
+    values = chunk.astype(object).where(chunk.notna(), None)
+    columns = [values[col].tolist() for col in chunk.columns]
+    # 时间列为 pd.Timestamp，转为标准 datetime（纯 Python 驱动按类型名查找转换函数）
+    for i, col in enumerate(chunk.columns):
+        if pd.api.types.is_datetime64_any_dtype(chunk[col]):
+            columns[i] = [v.to_pydatetime() if v is not None else None for v in columns[i]]
+    rows = zip(*columns)
+    cursor = conn.connection.cursor()
+    try:
+        while batch := list(islice(rows, EXECUTEMANY_BATCH)):
+            cursor.executemany(sql, batch)
+    finally:
+        cursor.close()
+
+def _load_one(engine, filename, table_name):
+    """加载单个 CSV 文件到对应的表，返回写入行数"""
+    file_path = os.path.join(DATASET_DIR, filename)
+
+    # 只读表头，确定当前文件需要的类型提示和日期列
+    header = pd.read_csv(file_path, nrows=0).columns
+    dtypes = {col: PANDAS_DTYPES[col] for col in header if col in PANDAS_DTYPES}
+    parse_dates = [col for col in DATE_COLS_BY_TABLE.get(table_name, []) if col in header]
+    dtype_mapping = {col: COLUMN_TYPES[col] for col in header if col in COLUMN_TYPES}
+    binary_cols = [col for col in header if col in ID_COLS] if COMPACT_IDS else []
+    for col in binary_cols:
+        dtype_mapping[col] = BINARY(16)
+
+    if USE_LOAD_DATA:
         try:
-            df = pd.read_csv(file_path)
-
-            if 'order_purchase_timestamp' in df.columns:
-                date_cols = [col for col in df.columns if 'date' in col or 'timestamp' in col]
-                for col in date_cols:
-                    df[col] = pd.to_datetime(df[col], errors='coerce')
-
-            dtype_mapping = {col: column_types[col] for col in df.columns if col in column_types}
-
-            start_table = time.time()
-            df.to_sql(
+            # 只读少量样本行推断列类型，用空 DataFrame 建表以保留类型映射，数据由服务端直接读取源 CSV
+            sample = pd.read_csv(file_path, dtype=dtypes, parse_dates=parse_dates,
+                                 date_format='%Y-%m-%d %H:%M:%S', nrows=1000)
+            sample.head(0).to_sql(
                 name=table_name,
                 con=engine,
                 if_exists='replace',
                 index=False,
-                chunksize=1000,
                 dtype=dtype_mapping
             )
-            end_table = time.time()
+            return load_data_infile(engine, file_path, table_name, list(header), binary_cols)
+        except Exception as e:
+            print(f"  - {table_name}: LOAD DATA 失败，回退到 to_sql: {e}")
 
-            print(f"  - 成功写入 {len(df)} 行，耗时: {end_table - start_table:.2f} 秒")
+    if CSV_ENGINE == 'pyarrow':
+        reader = [_read_csv_arrow(file_path, dtypes, parse_dates)]
+    else:
+        # 分块读取：类型转换和日期解析在 C 解析器中一次完成，内存占用有上界
+        # 显式日期格式，避免逐值推断格式
+        reader = pd.read_csv(file_path, dtype=dtypes, parse_dates=parse_dates,
+                             date_format='%Y-%m-%d %H:%M:%S', chunksize=200_000)
+
+    total_rows = 0
+    with bulk_session(engine) as conn:
+        for i, chunk in enumerate(reader):
+            for col in binary_cols:
+                chunk[col] = chunk[col].map(_hex_to_bin)
+
+            # to_sql 只负责按类型映射建表，数据走原生游标的 executemany
+            if i == 0:
+                chunk.head(0).to_sql(
+                    name=table_name,
+                    con=conn,
+                    if_exists='replace',
+                    index=False,
+                    dtype=dtype_mapping
+                )
+            _insert_rows(conn, table_name, chunk)
+            total_rows += len(chunk)
+
+    return total_rows
+
+def _timed_load(engine, filename, table_name):
+    """加载单个文件并计时；engine 为 None 时（子进程内）自建独立引擎，用完释放"""
+    start_table = time.time()
+    own_engine = engine is None
+    if own_engine:
+        # 引擎不能跨进程共享，子进程各自建立连接
+        engine = create_engine(CONNECTION_STR, pool_size=1, pool_pre_ping=True, connect_args=_connect_args())
+    try:
+        rows = _load_one(engine, filename, table_name)
+    finally:
+        if own_engine:
+            engine.dispose()
+    return rows, time.time() - start_table
 
-        except Exception as e:
-            print(f"  - 写入失败: {e}")
+def load_data(engine):
+    """加载 CSV 数据到 MySQL（多个文件并行导入）"""
+    print("\n=== 开始数据加载 (MySQL) ===")
+    start_total = time.time()
+
+    # 各表相互独立：一个文件解析 CSV 时，另一个文件的网络写入可以同时进行
+    futures = {}
+    executor_cls = ProcessPoolExecutor if LOAD_PROCESSES else ThreadPoolExecutor
+    worker_engine = None if LOAD_PROCESSES else engine
+    with executor_cls(max_workers=min(LOAD_WORKERS, len(CSV_FILES))) as executor:
+        for filename, table_name in CSV_FILES.items():
+            if not os.path.exists(os.path.join(DATASET_DIR, filename)):
+                print(f"警告: 文件 {filename} 不存在，跳过。")
+                continue
+
+            print(f"正在处理 {filename} -> 表: {table_name} ...")
+            futures[executor.submit(_timed_load, worker_engine, filename, table_name)] = table_name
+
+        for future in as_completed(futures):
+            table_name = futures[future]
+            try:
+                rows, elapsed = future.result()
+                print(f"  - {table_name}: 成功写入 {rows} 行，耗时: {elapsed:.2f} 秒")
+            except Exception as e:
+                print(f"  - {table_name}: 写入失败: {e}")
 
     end_total = time.time()
     print(f"=== 数据加载完成，总耗时: {end_total - start_total:.2f} 秒 ===\n")
 
+# 已获取的样本 ID，按 (表, 列) 缓存，各测试阶段复用同一批样本
+_SAMPLE_CACHE = {}
+
 def get_random_samples(engine, table, column, limit=100):
-    """从数据库获取随机样本"""
+    """由服务端在全表范围内均匀抽样（带种子，可复现）"""
+    key = (table, column)
+    if key in _SAMPLE_CACHE:
+        return _SAMPLE_CACHE[key]
+
     try:
         with engine.connect() as conn:
-            sql = text(f"SELECT {column} FROM {table} LIMIT 5000")
-            result = conn.execute(sql).fetchall()
-            all_ids = [row[0] for row in result]
-            if not all_ids:
+            count = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+            if not count:
                 return []
-            return random.sample(all_ids, min(limit, len(all_ids)))
+            # 每行以概率 p 入选（取 3 倍余量），不加 LIMIT 以免扫描提前结束、样本集中在表的前半段；
+            # 再用带种子的 random.sample 裁剪到 limit 个。只在测试开始时扫描一次，结果缓存供各阶段复用
+            p = min(1.0, 3.0 * limit / count)
+            sql = text(f"SELECT {column} FROM {table} WHERE RAND(:seed) < :p")
+            samples = conn.execute(sql, {"seed": BENCH_SEED, "p": p}).scalars().all()
+            if len(samples) > limit:
+                samples = random.Random(BENCH_SEED).sample(samples, limit)
+            _SAMPLE_CACHE[key] = samples
+            return samples
     except Exception as e:
         print(f"获取样本数据失败 ({table}.{column}): {e}")
         return []
@@ -141,41 +402,114 @@ def create_indexes(engine):
     print("\n=== 正在创建索引 (Indexing) ===")
     start_time = time.time()
 
+    # 格式: (表名, 索引名, 列, 索引类型)
+    # 复合索引的列顺序按查询谓词排列：等值列在前，范围列/覆盖列在后
     indexes = [
-        ('orders', 'idx_orders_customer_id', 'customer_id'),
-        ('order_items', 'idx_items_order_id', 'order_id'),
-        ('order_items', 'idx_items_product_id', 'product_id'),
-        ('products', 'idx_products_product_id', 'product_id'),
-        ('customers', 'idx_customers_customer_id', 'customer_id'),
-        ('orders', 'idx_orders_date', 'order_purchase_timestamp'),
-        ('order_items', 'idx_items_price', 'price'),
-        ('customers', 'idx_customers_city', 'customer_city'),
-        ('products', 'idx_products_category', 'product_category_name'),
-        ('order_reviews', 'idx_reviews_comment', 'review_comment_message')
+        ('orders', 'idx_orders_cust_date', '(customer_id, order_purchase_timestamp)', 'INDEX'),
+        ('order_items', 'idx_items_order_price', '(order_id, price)', 'INDEX'),
+        ('order_items', 'idx_items_product_id', '(product_id)', 'INDEX'),
+        ('products', 'idx_products_product_id', '(product_id)', 'INDEX'),
+        ('customers', 'idx_customers_customer_id', '(customer_id)', 'INDEX'),
+        ('orders', 'idx_orders_date', '(order_purchase_timestamp)', 'INDEX'),
+        ('order_items', 'idx_items_price_pid', '(price, product_id)', 'INDEX'),
+        ('customers', 'idx_customers_city', '(customer_city)', 'INDEX'),
+        ('products', 'idx_products_category', '(product_category_name)', 'INDEX'),
+        # B-Tree 对 LIKE '%...%' 无效，评论搜索改用全文索引
+        ('order_reviews', 'idx_reviews_ft', '(review_comment_message)', 'FULLTEXT INDEX')
     ]
 
     with engine.connect() as conn:
-        for table, idx_name, column in indexes:
-            print(f"  - Creating index {idx_name} on {table}({column})...")
+        for table, idx_name, columns, index_type in indexes:
+            print(f"  - Creating {index_type.lower()} {idx_name} on {table}{columns}...")
             try:
-                # ✅ CHANGED: TEXT 列索引要前缀，否则容易报错
-                if column == "review_comment_message":
-                    conn.execute(text(f"CREATE INDEX {idx_name} ON {table} ({column}(100))"))
-                else:
-                    conn.execute(text(f"CREATE INDEX {idx_name} ON {table} ({column})"))
+                conn.execute(text(f"CREATE {index_type} {idx_name} ON {table} {columns}"))
                 conn.commit()
             except Exception as e:
                 print(f"    Warning: {e}")
 
+        # 建完索引后刷新统计信息，优化器按最新基数选择索引
+        tables = sorted({table for table, *_ in indexes})
+        try:
+            conn.execute(text(f"ANALYZE TABLE {', '.join(tables)}")).fetchall()
+        except Exception as e:
+            print(f"    Warning: ANALYZE TABLE 失败: {e}")
+
     print(f"=== 索引创建完成，耗时: {time.time() - start_time:.2f} 秒 ===\n")
 
-def execute_query(engine, sql):
-    """执行 SQL 查询并返回结果"""
+def build_rollups(engine):
+    """预聚合汇总表：聚合查询只需读取几十行汇总结果，而不是每次扫描全表；返回构建成功的表名集合"""
+    print("\n=== 正在构建预聚合表 (Rollups) ===")
+    start_time = time.time()
+
+    # 格式: (汇总表名, 汇总 SELECT, 索引列)
+    rollups = [
+        ('orders_monthly',
+         "SELECT DATE_FORMAT(order_purchase_timestamp, '%Y-%m') AS month, COUNT(*) AS orders "
+         "FROM orders GROUP BY month",
+         '(month)'),
+        ('customers_by_city',
+         "SELECT customer_city, COUNT(*) AS cnt FROM customers GROUP BY customer_city",
+         '(cnt DESC)'),
+    ]
+
+    built = set()
+    with engine.connect() as conn:
+        for table, select_sql, columns in rollups:
+            try:
+                conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+                conn.execute(text(f"CREATE TABLE {table} AS {select_sql}"))
+                conn.execute(text(f"CREATE INDEX idx_{table} ON {table} {columns}"))
+                conn.commit()
+                built.add(table)
+                print(f"  - {table} 已构建")
+            except Exception as e:
+                conn.rollback()
+                print(f"    Warning: {e}")
+
+    print(f"=== 预聚合表构建完成，耗时: {time.time() - start_time:.2f} 秒 ===\n")
+    return built
+
+def update_histograms(engine):
+    """为分组/过滤列建立直方图统计（MySQL 8+），无索引阶段优化器也能估算选择度"""
+    # 格式: (表名, 列)
+    histograms = [
+        ('customers', 'customer_city'),
+        ('products', 'product_category_name'),
+        ('orders', 'order_purchase_timestamp'),
+        ('order_items', 'price'),
+    ]
+
     with engine.connect() as conn:
-        result = conn.execute(text(sql))
-        return [dict(row._mapping) for row in result]
+        for table, column in histograms:
+            try:
+                conn.execute(text(f"ANALYZE TABLE {table} UPDATE HISTOGRAM ON {column} WITH 64 BUCKETS")).fetchall()
+            except Exception as e:
+                print(f"    Warning: 直方图 {table}.{column} 创建失败: {e}")
+
+def execute_query(conn, stmt, params=None):
+    """在已有连接上执行预编译的 SQL 并返回结果"""
+    result = conn.execute(stmt, params or {})
+    return [dict(row._mapping) for row in result]
+
+def count_rows(conn, stmt, params=None):
+    """流式遍历结果只计数，不构建行列表；用于只测数据库耗时的场景"""
+    # mysqldb 驱动下为服务端游标；mysqlconnector 不支持时 SQLAlchemy 自动退回普通游标
+    # 选项按次传入：Connection.execution_options() 会原地修改共享连接，影响之后的 execute_query
+    result = conn.execute(stmt, params or {}, execution_options={"stream_results": True, "yield_per": 1000})
+    return sum(1 for _ in result)
+
+def _skipped_result(q):
+    """未测查询的结果，各项耗时记为 NaN（报告中显示 N/A）"""
+    return {
+        "Type": q['type'],
+        "Name": q['name'],
+        "Cold": math.nan,
+        "Time": math.nan,
+        "P95": math.nan,
+        "Stdev": math.nan
+    }
 
-def run_benchmark(engine, label="No Index", cache=None):
+def run_benchmark(engine, label="No Index", cache=None, rollups=()):
     """执行查询性能测试"""
     print(f"=== 开始查询性能测试 [{label}] ===\n")
 
@@ -190,15 +524,23 @@ def run_benchmark(engine, label="No Index", cache=None):
         {
             "type": "简单查询 (Point Query)",
             "name": "查询用户订单 (By Customer ID)",
-            "sql_template": "SELECT * FROM orders WHERE customer_id = '{param}'",
+            "sql_template": "SELECT * FROM orders WHERE customer_id = :param",
             "params": sample_customer_ids
         },
         {
             "type": "简单查询 (Point Query)",
             "name": "查询商品详情 (By Product ID)",
-            "sql_template": "SELECT * FROM products WHERE product_id = '{param}'",
+            "sql_template": "SELECT * FROM products WHERE product_id = :param",
             "params": sample_product_ids
         },
+        {
+            "type": "简单查询 (Point Query)",
+            "name": "批量用户订单 (Batch by Customer IDs)",
+            # 一次 IN 查询取全部样本用户的订单，代替逐个点查的多次往返
+            "sql_template": "SELECT * FROM orders WHERE customer_id IN :param",
+            "params": [tuple(sample_customer_ids)],
+            "expanding": True
+        },
         {
             "type": "范围查询 (Range Query)",
             "name": "时间范围查询 (Orders by Date)",
@@ -213,9 +555,9 @@ def run_benchmark(engine, label="No Index", cache=None):
         },
         {
             "type": "文本搜索 (Text Search)",
-            "name": "评论关键词搜索 (LIKE)",
-            "sql_template": "SELECT * FROM order_reviews WHERE review_comment_message LIKE '%estão%' LIMIT 100",
-            "params": None
+            "name": "评论关键词搜索 (FULLTEXT)",
+            "sql_template": "SELECT * FROM order_reviews WHERE MATCH(review_comment_message) AGAINST(:param IN NATURAL LANGUAGE MODE) LIMIT 100",
+            "params": REVIEW_KEYWORDS
         },
         {
             "type": "聚合查询 (Aggregation)",
@@ -234,6 +576,20 @@ def run_benchmark(engine, label="No Index", cache=None):
             """,
             "params": None
         },
+        {
+            "type": "聚合查询 (Aggregation)",
+            "name": "月度销售额 (Rollup)",
+            "sql_template": "SELECT month, orders FROM orders_monthly ORDER BY month",
+            "params": None,
+            "requires": "orders_monthly"
+        },
+        {
+            "type": "聚合查询 (Aggregation)",
+            "name": "热门城市统计 (Rollup)",
+            "sql_template": "SELECT customer_city, cnt AS count FROM customers_by_city ORDER BY cnt DESC LIMIT 10",
+            "params": None,
+            "requires": "customers_by_city"
+        },
         {
             "type": "复杂关联 (Join)",
             "name": "商品类别销售额 (Category Sales)",
@@ -262,7 +618,7 @@ def run_benchmark(engine, label="No Index", cache=None):
                 JOIN orders o ON c.customer_id = o.customer_id
                 JOIN order_items oi ON o.order_id = oi.order_id
                 JOIN products p ON oi.product_id = p.product_id
-                WHERE c.customer_id = '{param}'
+                WHERE c.customer_id = :param
             """,
             "params": sample_customer_ids
         }
@@ -274,7 +630,7 @@ def run_benchmark(engine, label="No Index", cache=None):
         "查询商品详情 (By Product ID)",
         "时间范围查询 (Orders by Date)",
         "价格范围查询 (Items by Price)",
-        "评论关键词搜索 (LIKE)",
+        "评论关键词搜索 (FULLTEXT)",
         "热门城市统计 (Top 10 Cities)",
         "月度销售额 (Monthly Sales)",
         "商品类别销售额 (Category Sales)",
@@ -283,42 +639,90 @@ def run_benchmark(engine, label="No Index", cache=None):
 
     results = []
 
-    for q in queries:
-        print(f"测试: [{q['type']}] {q['name']}")
-
-        # ✅ CHANGED: 固定一个热点 param，让缓存命中（最少改动但能看到提升）
-        hot_param = random.choice(q['params']) if q['params'] else None
-
-        times = []
-        for i in range(10):
-            if q['params']:
-                param = hot_param  # 固定热点
-                sql = q['sql_template'].format(param=param)
-            else:
-                sql = q['sql_template']
-
-            start = time.time()
-
-            if cache and q["name"] in CACHEABLE:
-                # ✅ CHANGED: 稳定 key（md5），避免 hash() 每次运行不一样、以及碰撞
-                cache_key = "mysql:" + hashlib.md5(sql.encode("utf-8")).hexdigest()
-                _ = cache.cache_aside(cache_key, lambda s=sql: execute_query(engine, s))
-            else:
-                _ = execute_query(engine, sql)
+    # 整个测试复用同一个连接；SQL 只编译一次，参数以绑定变量传入
+    with engine.connect() as conn:
+        for q in queries:
+            print(f"测试: [{q['type']}] {q['name']}")
+
+            # 依赖的预聚合表未构建成功时不测，避免表不存在的错误中断整个测试
+            if q.get('requires') and q['requires'] not in rollups:
+                print(f"  -> 跳过: 预聚合表 {q['requires']} 不存在")
+                results.append(_skipped_result(q))
+                continue
+
+            stmt = text(q['sql_template'])
+            if q.get('expanding'):
+                # IN 列表参数按元素展开为多个绑定变量
+                stmt = stmt.bindparams(bindparam('param', expanding=True))
+
+            # ✅ CHANGED: 固定一个热点 param，让缓存命中（最少改动但能看到提升）
+            hot_param = random.choice(q['params']) if q['params'] else None
+            params = {"param": hot_param} if q['params'] else {}
+
+            # ✅ CHANGED: 稳定 key（md5），避免 hash() 每次运行不一样、以及碰撞
+            raw = f"{q['sql_template']}|{hot_param}"
+            cache_key = "mysql:" + hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+            def run_once():
+                if cache and q["name"] in CACHEABLE:
+                    _ = cache.cache_aside(cache_key, lambda: execute_query(conn, stmt, params))
+                else:
+                    # 无缓存阶段只计时数据库端，不在 Python 中物化结果；缓存阶段需要完整数据写回 Redis
+                    _ = count_rows(conn, stmt, params)
 
-            end = time.time()
-            times.append(end - start)
+            # 首次执行单独计时（冷启动：服务端缓冲池/客户端缓存均未命中）
+            t0 = time.perf_counter_ns()
+            try:
+                run_once()
+            except Exception as e:
+                # 与 MongoDB 的 $text 一致：无全文索引时 MATCH 会报错，本阶段不测该查询
+                if "FULLTEXT" not in str(e):
+                    raise
+                conn.rollback()
+                print("  -> 跳过: 当前阶段没有全文索引")
+                results.append(_skipped_result(q))
+                continue
+            cold_time = (time.perf_counter_ns() - t0) / 1e9
+
+            # 预热兼定批量：autorange 不计入结果，累计运行至少 0.2s 后缓冲池、执行计划与缓存都处于热状态
+            # 亚毫秒级查询每个样本连续执行 reps 次取平均，避免单次测量落在计时噪声内
+            number, _ = timeit.Timer(run_once, timer=time.perf_counter).autorange()
+            reps = max(1, number // 10)
+
+            times = []
+            for _ in range(BENCH_RUNS):
+                t0 = time.perf_counter_ns()
+                for _ in range(reps):
+                    run_once()
+                times.append((time.perf_counter_ns() - t0) / reps)
+
+            # 中位数与 p95 不受个别离群值影响；单位换算为秒
+            median_time = statistics.median(times) / 1e9
+            p95_time = statistics.quantiles(times, n=100)[94] / 1e9 if len(times) > 1 else median_time
+            stdev_time = statistics.pstdev(times) / 1e9
+            print(f"  -> 首次: {cold_time * 1000:.3f}ms | 中位数: {median_time * 1000:.3f}ms | p95: {p95_time * 1000:.3f}ms | "
+                  f"标准差: {stdev_time * 1000:.3f}ms (每样本 {reps} 次)")
+
+            results.append({
+                "Type": q['type'],
+                "Name": q['name'],
+                "Cold": cold_time,
+                "Time": median_time,
+                "P95": p95_time,
+                "Stdev": stdev_time
+            })
 
-        avg_time = sum(times) / len(times)
-        print(f"  -> 平均: {avg_time:.4f}s")
+    return results
 
-        results.append({
-            "Type": q['type'],
-            "Name": q['name'],
-            "Time": avg_time
-        })
+def _speedup(before, after):
+    """加速比；任一阶段未测（NaN）时同样返回 NaN，分母为 0 时记为 0"""
+    if math.isnan(before) or math.isnan(after):
+        return math.nan
+    return before / after if after > 0 else 0
 
-    return results
+def _fmt(value, spec, suffix=""):
+    """格式化数值，未测（NaN）时显示 N/A"""
+    return "N/A" if math.isnan(value) else format(value, spec) + suffix
 
 def main():
     max_retries = 10
@@ -346,18 +750,25 @@ def main():
         except EOFError:
             print("无法读取输入，跳过数据加载。")
 
+    # 预聚合表依赖已加载的数据，每次运行前重建
+    rollups = build_rollups(engine)
+    update_histograms(engine)
+
+    random.seed(BENCH_SEED)
+
     # 初始化缓存（Redis 必须可用）
-    cache = CacheHelper()
+    # 关闭进程内 L1，缓存阶段测的是 Redis 命中而非本地字典查找
+    cache = CacheHelper(l1_size=0)
 
     # 阶段 1: 无索引
-    results_no_index = run_benchmark(engine, label="No Index")
+    results_no_index = run_benchmark(engine, label="No Index", rollups=rollups)
 
     # 阶段 2: 有索引
     create_indexes(engine)
-    results_with_index = run_benchmark(engine, label="With Index")
+    results_with_index = run_benchmark(engine, label="With Index", rollups=rollups)
 
     # 阶段 3: 有索引 + Redis 缓存
-    results_with_cache = run_benchmark(engine, label="With Index + Redis Cache", cache=cache)
+    results_with_cache = run_benchmark(engine, label="With Index + Redis Cache", cache=cache, rollups=rollups)
 
     # 对比报告（每条都打印 “前 -> 后” 的具体用时）
     print("\n=== MySQL 性能对比报告 (3 阶段，含前后用时) ===")
@@ -368,23 +779,25 @@ def main():
         t_idx = r2["Time"]
         t_cache = r3["Time"]
 
-        speedup_index = (t_no / t_idx) if t_idx > 0 else 0
-        speedup_cache = (t_idx / t_cache) if t_cache > 0 else 0
+        # 某阶段未测（如无全文索引时的 FULLTEXT 查询、预聚合表缺失）记为 N/A，不参与加速比
+        speedup_index = _speedup(t_no, t_idx)
+        speedup_cache = _speedup(t_idx, t_cache)
+        s_no, s_idx, s_cache = (_fmt(t, ".4f") for t in (t_no, t_idx, t_cache))
 
         # ✅ 这里是你要的：逐项打印“前 -> 后”的具体用时
         print(f"- {r1['Name']}")
-        print(f"  Index: {t_no:.4f}s -> {t_idx:.4f}s  (x{speedup_index:.2f}, 省 {t_no - t_idx:.4f}s)")
-        print(f"  Cache: {t_idx:.4f}s -> {t_cache:.4f}s (x{speedup_cache:.2f}, 省 {t_idx - t_cache:.4f}s)")
+        print(f"  Index: {s_no}s -> {s_idx}s  (x{_fmt(speedup_index, '.2f')}, 省 {_fmt(t_no - t_idx, '.4f')}s)")
+        print(f"  Cache: {s_idx}s -> {s_cache}s (x{_fmt(speedup_cache, '.2f')}, 省 {_fmt(t_idx - t_cache, '.4f')}s)")
 
         comparison.append({
             "Query Name": r1["Name"],
-            "No Index (s)": f"{t_no:.4f}",
-            "With Index (s)": f"{t_idx:.4f}",
-            "With Cache (s)": f"{t_cache:.4f}",
-            "Index Before->After": f"{t_no:.4f}->{t_idx:.4f}",
-            "Cache Before->After": f"{t_idx:.4f}->{t_cache:.4f}",
-            "Index Speedup": f"{speedup_index:.2f}x",
-            "Cache Speedup": f"{speedup_cache:.2f}x",
+            "No Index (s)": s_no,
+            "With Index (s)": s_idx,
+            "With Cache (s)": s_cache,
+            "Index Before->After": f"{s_no}->{s_idx}",
+            "Cache Before->After": f"{s_idx}->{s_cache}",
+            "Index Speedup": _fmt(speedup_index, ".2f", "x"),
+            "Cache Speedup": _fmt(speedup_cache, ".2f", "x"),
         })
 
     print("\n=== 汇总表 ===")